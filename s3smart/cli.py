@@ -5,23 +5,61 @@ s3smart: high-throughput S3 copy/sync with resume, checksums, browse mode
 """
 
 import argparse
+import base64
+import contextlib
 import hashlib
+import io
 import json
+import mmap
 import os
 import sys
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
-from urllib.parse import urlparse
-from typing import Optional
+from typing import NamedTuple, Optional
 
 from s3smart.version import get_version_info
 
 import boto3
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
 from botocore.client import Config as BotoConfig
 from botocore.exceptions import BotoCoreError, ClientError
+from s3transfer.subscribers import BaseSubscriber
 from tqdm import tqdm
 
+try:
+    import awscrt
+    HAS_CRT = True
+except ImportError:
+    HAS_CRT = False
+
+
+def crt_transfer_supported() -> bool:
+    """boto3's CRT transfer manager needs awscrt 0.19.18 or newer."""
+    if not HAS_CRT:
+        return False
+    try:
+        version = tuple(int(x) for x in awscrt.__version__.split("."))
+    except (AttributeError, ValueError):
+        return False
+    return version >= (0, 19, 18)
+
+
+try:
+    import orjson
+
+    def json_loads(data: bytes):
+        return orjson.loads(data)
+
+    def json_dumps(obj, indent: bool = False) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+except ImportError:
+    def json_loads(data: bytes):
+        return json.loads(data)
+
+    def json_dumps(obj, indent: bool = False) -> bytes:
+        return json.dumps(obj, indent=2 if indent else None).encode()
 
 
 
@@ -32,6 +70,11 @@ from tqdm import tqdm
 S3_PREFIX = "s3://"
 DEFAULT_PART_MB = 64
 DEFAULT_WORKERS = 16
+STREAM_CHUNK = 256 * 1024
+RESUME_SUFFIX = ".s3smart-resume.json"
+PROGRESS_FLUSH_BYTES = 1024 * 1024
+# CRC32C needs awscrt in botocore; plain CRC32 is computed with zlib.
+CHECKSUM_ALGORITHM = "CRC32C" if HAS_CRT else "CRC32"
 
 CONFIG_PATH_HOME = Path.home() / ".s3smart.json"
 CONFIG_PATH_LOCAL = Path.cwd() / "s3smart.json"
@@ -46,8 +89,8 @@ def load_config(config_path: Path | None = None) -> dict:
     with descriptive comments.
     """
     def read_json(path: Path):
-        with open(path) as f:
-            return json.load(f)
+        with open(path, "rb") as f:
+            return json_loads(f.read())
 
     # Priority: custom path
     if config_path and config_path.exists():
@@ -80,8 +123,8 @@ def load_config(config_path: Path | None = None) -> dict:
 
     print("⚙️ No existing configuration found.")
     print(f"🪄 Creating default configuration at {CONFIG_PATH_LOCAL}")
-    with open(CONFIG_PATH_LOCAL, "w") as f:
-        json.dump(default_cfg, f, indent=2)
+    with open(CONFIG_PATH_LOCAL, "wb") as f:
+        f.write(json_dumps(default_cfg, indent=True))
     print(f"Default config created: {CONFIG_PATH_LOCAL}")
     return default_cfg
 
@@ -90,23 +133,22 @@ def load_config(config_path: Path | None = None) -> dict:
 # --------------------------
 
 def is_s3_uri(uri: str) -> bool:
-    return uri.lower().startswith(S3_PREFIX)
+    return uri[:len(S3_PREFIX)].lower() == S3_PREFIX
 
 
-class S3Url:
-    def __init__(self, bucket: str, key: str):
-        self.bucket = bucket
-        self.key = key
+class S3Url(NamedTuple):
+    bucket: str
+    key: str
 
 
 def parse_s3_url(uri: str) -> S3Url:
     if not is_s3_uri(uri):
         raise ValueError(f"Not an S3 URI: {uri}")
-    p = urlparse(uri)
-    return S3Url(p.netloc, p.path.lstrip("/"))
+    bucket, _, key = uri[len(S3_PREFIX):].partition("/")
+    return S3Url(bucket, key)
 
 
-def md5_of_file(path: str, chunk: int = 8 * 1024 * 1024) -> str:
+def md5_of_file(path: str, chunk: int = 16 * 1024 * 1024) -> str:
     h = hashlib.md5()
     with open(path, "rb") as f:
         while True:
@@ -117,166 +159,841 @@ def md5_of_file(path: str, chunk: int = 8 * 1024 * 1024) -> str:
     return h.hexdigest()
 
 
+def clear_screen() -> None:
+    """Clear the terminal with an ANSI escape; no-op when stdout is not a TTY."""
+    if not sys.stdout.isatty():
+        return
+    if os.name == "nt":
+        try:
+            import colorama
+            colorama.just_fix_windows_console()
+        except (ImportError, AttributeError):
+            pass
+    sys.stdout.write("\x1b[2J\x1b[H")
+    sys.stdout.flush()
+
+
 def ensure_parent(path: str) -> None:
     Path(path).parent.mkdir(parents=True, exist_ok=True)
 
+
+def fits_single_part(size: int, part_size: int) -> bool:
+    """Objects this small go in one PUT/GET instead of a multipart transfer."""
+    return size <= part_size
+
+
+def iter_files(root: str):
+    """
+    Yield ``(path, size)`` for every regular file under ``root``, like
+    os.walk (symlinked files are included, symlinked dirs are not entered,
+    unreadable dirs are reported and skipped).
+    Uses os.scandir so sizes come from the directory read's cached stat.
+    """
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError as e:
+            print(f"Skipping unreadable directory {d}: {e}")
+            continue
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                        continue
+                    if e.name.endswith(RESUME_SUFFIX) or not e.is_file():
+                        continue
+                    size = e.stat().st_size
+                except OSError as err:
+                    print(f"Skipping unreadable file {e.path}: {err}")
+                    continue
+                yield e.path, size
+
+
+def checksum_algorithm(args) -> str | None:
+    """Per-part integrity check requested on the command line, if any."""
+    if getattr(args, "legacy_md5", False):
+        return "MD5"
+    if getattr(args, "checksum", False):
+        return CHECKSUM_ALGORITHM
+    return None
+
+
+def rate_limit_bytes(args) -> int | None:
+    """--max-mbps (MB/s) as bytes per second, or None when unlimited."""
+    if not getattr(args, "max_mbps", None):
+        return None
+    return int(args.max_mbps * 1024 * 1024)
+
+# --------------------------
+# Progress
+# --------------------------
+
+class NullProgress:
+    """Progress sink used when stderr is not a terminal (pipes, CI, logs)."""
+
+    def update(self, n: int) -> None:
+        pass
+
+    def add_total(self, n: int) -> None:
+        pass
+
+    def write(self, msg: str) -> None:
+        # One write per line so messages from worker threads don't interleave.
+        sys.stdout.write(msg + "\n")
+
+    def close(self) -> None:
+        pass
+
+
+class ProgressAccumulator:
+    """
+    Thread-safe front for a tqdm bar that coalesces small updates and only
+    forwards them once ``threshold`` bytes have accumulated.
+    """
+
+    def __init__(self, bar, threshold: int = PROGRESS_FLUSH_BYTES):
+        self.bar = bar
+        self.threshold = threshold
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def update(self, n: int) -> None:
+        with self.lock:
+            self.pending += n
+            if self.pending < self.threshold:
+                return
+            n, self.pending = self.pending, 0
+            self.bar.update(n)
+
+    def add_total(self, n: int) -> None:
+        with self.lock:
+            self.bar.total += n
+
+    def write(self, msg: str) -> None:
+        self.bar.write(msg)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.pending:
+                self.bar.update(self.pending)
+                self.pending = 0
+        self.bar.close()
+
+
+def make_progress(total: int, desc: str):
+    if not sys.stderr.isatty():
+        return NullProgress()
+    bar = tqdm(total=total, unit="B", unit_scale=True, desc=desc,
+               dynamic_ncols=False, mininterval=0.25, maxinterval=1.0,
+               miniters=1 << 20)
+    return ProgressAccumulator(bar)
+
 # --------------------------
 # Rate limiter
 # --------------------------
 
 class RateLimiter:
+    """
+    Token bucket kept in integer nanoseconds of transfer credit: one second
+    of credit equals ``rate_bps`` bytes, and the bucket holds at most one
+    second. Integer math avoids float drift on long transfers.
+    """
+
+    CAP_NS = 10 ** 9
+
     def __init__(self, max_bytes_per_sec: float | None):
-        self.rate = max_bytes_per_sec or 0.0
-        self.tokens = 0.0
-        self.last = time.monotonic()
+        self.rate_bps = int(max_bytes_per_sec or 0)
+        self.tokens_ns = 0
+        self.last_ns = time.monotonic_ns()
         self.lock = threading.Lock()
 
     def consume(self, nbytes: int) -> None:
-        if not self.rate or self.rate <= 0:
+        if self.rate_bps <= 0:
             return
-        with self.lock:
-            while True:
-                now = time.monotonic()
-                elapsed = now - self.last
-                self.last = now
-                self.tokens += elapsed * self.rate
-                if self.tokens > self.rate:
-                    self.tokens = self.rate
-                if self.tokens >= nbytes:
-                    self.tokens -= nbytes
-                    return
-                need = nbytes - self.tokens
-                sleep_for = need / self.rate
-                self.lock.release()
-                try:
-                    time.sleep(min(sleep_for, 0.1))
-                finally:
-                    self.lock.acquire()
+        # Reserve credit up front (the bucket may go negative) and sleep off
+        # the deficit outside the lock. Writes larger than the bucket are
+        # split so no single reservation exceeds its capacity.
+        while nbytes > 0:
+            step = min(nbytes, self.rate_bps)
+            nbytes -= step
+            need_ns = step * 10 ** 9 // self.rate_bps
+            with self.lock:
+                now_ns = time.monotonic_ns()
+                self.tokens_ns = min(self.CAP_NS,
+                                     self.tokens_ns + now_ns - self.last_ns)
+                self.last_ns = now_ns
+                self.tokens_ns -= need_ns
+                if self.tokens_ns >= 0:
+                    continue
+                wait_ns = -self.tokens_ns
+            time.sleep(wait_ns / 1e9)
 
 # --------------------------
 # S3 client
 # --------------------------
 
+def drop_expect_header(request, **kwargs) -> None:
+    del request.headers["Expect"]
+
+
 def make_s3_client(region: str | None,
                    max_pool: int,
                    retries: int,
-                   endpoint_url: str | None):
+                   endpoint_url: str | None,
+                   session=None):
     cfg = BotoConfig(
         retries={"max_attempts": max(3, retries), "mode": "standard"},
         max_pool_connections=max(10, max_pool),
         signature_version="s3v4",
+        tcp_keepalive=True,
     )
-    return boto3.client("s3",
-                        region_name=region,
-                        endpoint_url=endpoint_url,
-                        config=cfg)
+    s3 = (session or boto3).client("s3",
+                                   region_name=region,
+                                   endpoint_url=endpoint_url,
+                                   config=cfg)
+    # botocore adds "Expect: 100-continue" to large PUTs, which costs an
+    # extra round trip per part before the body is sent.
+    for op in ("PutObject", "UploadPart"):
+        s3.meta.events.register(f"before-sign.s3.{op}", drop_expect_header)
+    return s3
+
+
+def required_pool_size(args) -> int:
+    """
+    Connections needed so no in-flight request waits on (or discards) a pooled
+    connection: the command's shared part-level pool, plus the file-level
+    pool for upload/download, with a little headroom.
+    """
+    workers = max(1, getattr(args, "workers", DEFAULT_WORKERS))
+    pools = 2 if args.cmd in ("upload", "download") else 1
+    return workers * pools + 4
 
 # --------------------------
 # Multipart upload
 # --------------------------
 
+class MmapPartReader(io.RawIOBase):
+    """
+    Seekable, read-only file object over ``mm[start:end]``. Lets botocore
+    stream a part straight out of the page cache instead of a bytes copy.
+    """
+
+    def __init__(self, mm, start: int, end: int):
+        self.mm = mm
+        self.start = start
+        self.end = end
+        self.pos = start
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = max(0, min(len(b), self.end - self.pos))
+        with memoryview(self.mm) as mv:
+            b[:n] = mv[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.tell()
+        elif whence == io.SEEK_END:
+            offset += len(self)
+        self.pos = self.start + max(0, min(offset, len(self)))
+        return self.tell()
+
+    def tell(self) -> int:
+        return self.pos - self.start
+
+
+def put_small(s3,
+              local_path: str,
+              s3url: S3Url,
+              progress,
+              rate: RateLimiter,
+              checksum: str | None = None):
+    """Single-request upload for files below the multipart threshold."""
+    with open(local_path, "rb") as f:
+        data = f.read()
+    rate.consume(len(data))
+    extra = {}
+    if checksum == "MD5":
+        extra["ContentMD5"] = base64.b64encode(hashlib.md5(data).digest()).decode()
+    elif checksum:
+        extra["ChecksumAlgorithm"] = checksum
+    s3.put_object(Bucket=s3url.bucket, Key=s3url.key, Body=data, **extra)
+    progress.update(len(data))
+
+
+def load_resume_manifest(s3,
+                         manifest_path: str,
+                         s3url: S3Url,
+                         part_size: int,
+                         fsize: int,
+                         mtime_ns: int,
+                         checksum: str | None) -> dict | None:
+    """
+    Load a resume manifest left by an interrupted upload of the same file.
+    Parts are kept only if S3 still lists them with the same ETag; returns
+    None when there is nothing usable to resume. A manifest that no longer
+    matches is about to be overwritten, so its upload is aborted first.
+    """
+    try:
+        with open(manifest_path, "rb") as f:
+            manifest = json_loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict):
+        return None
+    expected = {"bucket": s3url.bucket, "key": s3url.key, "part_size": part_size,
+                "size": fsize, "mtime_ns": mtime_ns, "checksum": checksum}
+    if any(manifest.get(k) != v for k, v in expected.items()):
+        abort_stale_upload(s3, manifest)
+        return None
+
+    remote = {}
+    try:
+        paginator = s3.get_paginator("list_parts")
+        for page in paginator.paginate(Bucket=s3url.bucket, Key=s3url.key,
+                                       UploadId=manifest["upload_id"]):
+            for p in page.get("Parts", []):
+                remote[p["PartNumber"]] = p["ETag"]
+    except ClientError:
+        return None
+    manifest["parts"] = {n: p for n, p in manifest.get("parts", {}).items()
+                         if remote.get(int(n)) == p["ETag"]}
+    return manifest
+
+
+def abort_stale_upload(s3, manifest: dict) -> None:
+    """Best-effort abort of the upload recorded in a rejected manifest."""
+    try:
+        s3.abort_multipart_upload(Bucket=manifest["bucket"],
+                                  Key=manifest["key"],
+                                  UploadId=manifest["upload_id"])
+    except (KeyError, TypeError, ClientError, BotoCoreError):
+        pass
+
+
+def save_resume_manifest(manifest_path: str, manifest: dict) -> None:
+    # Keep RESUME_SUFFIX last so a temp file left by a crash is still
+    # skipped when walking the source tree.
+    tmp = manifest_path[:-len(RESUME_SUFFIX)] + ".tmp" + RESUME_SUFFIX
+    with open(tmp, "wb") as f:
+        f.write(json_dumps(manifest))
+    os.replace(tmp, manifest_path)
+
+
 def multipart_upload(s3,
                      local_path: str,
                      s3url: S3Url,
                      workers: int,
                      part_size: int,
                      progress,
-                     rate: RateLimiter):
-    fsize = os.path.getsize(local_path)
-    mpu = s3.create_multipart_upload(Bucket=s3url.bucket, Key=s3url.key)
-    upload_id = mpu["UploadId"]
-
-    parts = []
-    with open(local_path, "rb") as f:
-        idx = 1
-        while True:
-            data = f.read(part_size)
-            if not data:
-                break
-            rate.consume(len(data))
+                     rate: RateLimiter,
+                     checksum: str | None = None,
+                     size: int | None = None,
+                     executor: ThreadPoolExecutor | None = None):
+    """
+    Upload a file as a multipart upload, sending up to ``workers`` parts at
+    once on ``executor`` (a private pool is created when none is given).
+    The file is memory-mapped and each part is streamed from the mapping,
+    so RSS stays flat regardless of file size. ``size`` skips the stat when
+    the caller already knows it. Files no larger than one part are sent
+    with a single put_object instead.
+
+    Progress is recorded in ``<local_path>.s3smart-resume.json``; a failed
+    upload is left open so the next run only sends the missing parts
+    (``s3smart abort`` cleans up uploads that will not be retried). If the
+    manifest cannot be written the upload is aborted on failure instead.
+
+    ``checksum`` is an S3 checksum algorithm (e.g. "CRC32C") that S3 verifies
+    per part, or "MD5" to send a legacy Content-MD5 header instead.
+    """
+    if size is None:
+        size = os.path.getsize(local_path)
+    if fits_single_part(size, part_size):
+        put_small(s3, local_path, s3url, progress, rate, checksum=checksum)
+        return
+
+    checksum_field = f"Checksum{checksum}"
+    manifest_path = local_path + RESUME_SUFFIX
+    manifest_lock = threading.Lock()
+    inflight = threading.Semaphore(max(1, workers) * 2)
+    failed = threading.Event()
+
+    def worker(mm, idx, start, end):
+        try:
+            rate.consume(end - start)
+            extra = {}
+            if checksum == "MD5":
+                with memoryview(mm) as mv, mv[start:end] as view:
+                    digest = hashlib.md5(view).digest()
+                extra["ContentMD5"] = base64.b64encode(digest).decode()
+            elif checksum:
+                extra["ChecksumAlgorithm"] = checksum
             resp = s3.upload_part(
                 Bucket=s3url.bucket,
                 Key=s3url.key,
                 PartNumber=idx,
                 UploadId=upload_id,
-                Body=data
+                Body=MmapPartReader(mm, start, end),
+                ContentLength=end - start,
+                **extra
             )
-            parts.append({"PartNumber": idx, "ETag": resp["ETag"]})
-            idx += 1
-            progress.update(len(data))
-
-    s3.complete_multipart_upload(
-        Bucket=s3url.bucket,
-        Key=s3url.key,
-        UploadId=upload_id,
-        MultipartUpload={"Parts": parts},
-    )
+            progress.update(end - start)
+            part = {"PartNumber": idx, "ETag": resp["ETag"]}
+            if checksum_field in resp:
+                part[checksum_field] = resp[checksum_field]
+            with manifest_lock:
+                manifest["parts"][str(idx)] = part
+                if resumable:
+                    try:
+                        save_resume_manifest(manifest_path, manifest)
+                    except OSError:
+                        pass
+            return part
+        except BaseException:
+            failed.set()
+            raise
+        finally:
+            inflight.release()
+
+    with open(local_path, "rb") as f:
+        st = os.fstat(f.fileno())
+        fsize = size
+
+        manifest = load_resume_manifest(s3, manifest_path, s3url, part_size,
+                                        fsize, st.st_mtime_ns, checksum)
+        if manifest is None:
+            create_args = {}
+            if checksum and checksum != "MD5":
+                create_args["ChecksumAlgorithm"] = checksum
+            mpu = s3.create_multipart_upload(Bucket=s3url.bucket,
+                                             Key=s3url.key, **create_args)
+            manifest = {"bucket": s3url.bucket, "key": s3url.key,
+                        "upload_id": mpu["UploadId"], "part_size": part_size,
+                        "size": fsize, "mtime_ns": st.st_mtime_ns,
+                        "checksum": checksum, "parts": {}}
+        upload_id = manifest["upload_id"]
+        try:
+            save_resume_manifest(manifest_path, manifest)
+            resumable = True
+        except OSError:
+            resumable = False
+
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            ex = executor or ThreadPoolExecutor(max_workers=workers)
+            futures = []
+            try:
+                offsets = range(0, fsize, part_size)
+                for idx, start in enumerate(offsets, 1):
+                    if failed.is_set():
+                        break
+                    end = min(start + part_size, fsize)
+                    if str(idx) in manifest["parts"]:
+                        progress.update(end - start)
+                        continue
+                    inflight.acquire()
+                    futures.append(ex.submit(worker, mm, idx, start, end))
+                for fut in as_completed(futures):
+                    fut.result()
+            except BaseException:
+                for fut in futures:
+                    fut.cancel()
+                raise
+            finally:
+                # Parts still running must finish before the mapping closes.
+                wait(futures)
+                if executor is None:
+                    ex.shutdown()
+                mm.close()
+
+            parts = sorted(manifest["parts"].values(),
+                           key=lambda p: p["PartNumber"])
+            s3.complete_multipart_upload(
+                Bucket=s3url.bucket,
+                Key=s3url.key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            if not resumable:
+                s3.abort_multipart_upload(Bucket=s3url.bucket,
+                                          Key=s3url.key,
+                                          UploadId=upload_id)
+            raise
+
+    if resumable:
+        try:
+            os.remove(manifest_path)
+        except OSError:
+            pass
 
 # --------------------------
 # Parallel download
 # --------------------------
 
+class RangeWriter:
+    """
+    Positional writer shared by all download threads. Uses a single fd with
+    os.pwrite where available; otherwise each thread keeps its own handle.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if hasattr(os, "pwrite"):
+            self.fd = os.open(path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+        else:
+            self.fd = None
+            self.local = threading.local()
+            self.handles = []
+            self.lock = threading.Lock()
+
+    def write(self, data, offset: int) -> None:
+        if self.fd is not None:
+            mv = memoryview(data)
+            while mv:
+                n = os.pwrite(self.fd, mv, offset)
+                mv = mv[n:]
+                offset += n
+            return
+        f = getattr(self.local, "f", None)
+        if f is None:
+            f = open(self.path, "r+b")
+            self.local.f = f
+            with self.lock:
+                self.handles.append(f)
+        f.seek(offset)
+        f.write(data)
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            return
+        for f in self.handles:
+            f.close()
+
+
+def get_small(s3,
+              s3url: S3Url,
+              local_path: str,
+              progress,
+              rate: RateLimiter):
+    """Single-request download for objects below the multipart threshold."""
+    ensure_parent(local_path)
+    body = s3.get_object(Bucket=s3url.bucket, Key=s3url.key)["Body"]
+    with open(local_path, "wb") as f:
+        while True:
+            buf = body.read(STREAM_CHUNK)
+            if not buf:
+                break
+            rate.consume(len(buf))
+            f.write(buf)
+            progress.update(len(buf))
+
+
 def parallel_download(s3,
                       s3url: S3Url,
                       local_path: str,
                       workers: int,
                       part_size: int,
                       progress,
-                      rate: RateLimiter):
-    head = s3.head_object(Bucket=s3url.bucket, Key=s3url.key)
-    size = head["ContentLength"]
+                      rate: RateLimiter,
+                      size: int | None = None,
+                      executor: ThreadPoolExecutor | None = None):
+    """
+    Download an object with ranged GETs across ``workers`` threads, on
+    ``executor`` if given. Pass ``size`` when it is already known (e.g. from
+    a listing) to skip the HEAD.
+    """
+    if size is None:
+        head = s3.head_object(Bucket=s3url.bucket, Key=s3url.key)
+        size = head["ContentLength"]
+    if fits_single_part(size, part_size):
+        get_small(s3, s3url, local_path, progress, rate)
+        return
 
     ensure_parent(local_path)
     with open(local_path, "wb") as f:
         f.truncate(size)
 
-    ranges = [(i, min(i + part_size, size) - 1)
-              for i in range(0, size, part_size)]
+    def gen_ranges():
+        for i in range(0, size, part_size):
+            yield (i, min(i + part_size, size) - 1)
+
+    writer = RangeWriter(local_path)
+    # Ranges are scheduled lazily so at most 2 * workers are queued at once;
+    # the first failure stops scheduling and is re-raised below. Workers
+    # record their own failure before their future completes, so it is
+    # visible as soon as wait() returns, even on a shared executor.
+    inflight = threading.BoundedSemaphore(max(1, workers) * 2)
+    errors = []
+    pending = set()
+    pending_lock = threading.Lock()
 
-    from concurrent.futures import ThreadPoolExecutor
     def worker(rng):
         start, end = rng
-        resp = s3.get_object(Bucket=s3url.bucket,
-                             Key=s3url.key,
-                             Range=f"bytes={start}-{end}")
-        chunk = resp["Body"].read()
-        rate.consume(len(chunk))
-        with open(local_path, "r+b") as f:
-            f.seek(start)
-            f.write(chunk)
-        progress.update(len(chunk))
-
-    with ThreadPoolExecutor(max_workers=workers) as ex:
-        ex.map(worker, ranges)
+        try:
+            resp = s3.get_object(Bucket=s3url.bucket,
+                                 Key=s3url.key,
+                                 Range=f"bytes={start}-{end}")
+            body = resp["Body"]
+            off = start
+            while True:
+                buf = body.read(STREAM_CHUNK)
+                if not buf:
+                    break
+                rate.consume(len(buf))
+                writer.write(buf, off)
+                off += len(buf)
+                progress.update(len(buf))
+        except BaseException as e:
+            errors.append(e)
+            raise
+
+    def done(fut):
+        with pending_lock:
+            pending.discard(fut)
+        inflight.release()
+
+    ex = executor or ThreadPoolExecutor(max_workers=workers)
+    try:
+        for rng in gen_ranges():
+            inflight.acquire()
+            if errors:
+                inflight.release()
+                break
+            fut = ex.submit(worker, rng)
+            with pending_lock:
+                pending.add(fut)
+            fut.add_done_callback(done)
+    finally:
+        with pending_lock:
+            running = list(pending)
+        wait(running)
+        if executor is None:
+            ex.shutdown()
+        writer.close()
+    if errors:
+        raise errors[0]
+
+# --------------------------
+# Managed transfers
+# --------------------------
+
+class ProgressSubscriber(BaseSubscriber):
+    """Feeds s3transfer progress into a progress object from make_progress."""
+
+    def __init__(self, progress, size: int | None = None):
+        self.progress = progress
+        self.size = size
+
+    def on_queued(self, future, **kwargs):
+        # Only the classic manager can take a known size; CRT's meta can't.
+        if self.size is not None and hasattr(future.meta, "provide_transfer_size"):
+            future.meta.provide_transfer_size(self.size)
+
+    def on_progress(self, future, bytes_transferred, **kwargs):
+        self.progress.update(bytes_transferred)
+
+
+def make_transfer_config(args) -> TransferConfig:
+    """
+    TransferConfig mirroring the CLI tuning. The CRT client is preferred when
+    a recent enough awscrt is installed, except for custom endpoints or
+    bandwidth caps, which only the classic s3transfer manager honours.
+    boto3 rejects CRT configs that set anything beyond the sizes and
+    concurrency, so those get no other options.
+    """
+    kwargs = {
+        # s3transfer goes multipart at size >= threshold; one part or less
+        # must stay a single request, as in fits_single_part.
+        "multipart_threshold": args.part_size + 1,
+        "multipart_chunksize": args.part_size,
+        "max_concurrency": args.workers,
+    }
+    max_bandwidth = rate_limit_bytes(args)
+    if not max_bandwidth and crt_transfer_supported() \
+            and not getattr(args, "endpoint_url", None):
+        kwargs["preferred_transfer_client"] = "crt"
+        return TransferConfig(**kwargs)
+    kwargs["use_threads"] = True
+    kwargs["preferred_transfer_client"] = "classic"
+    if max_bandwidth:
+        kwargs["max_bandwidth"] = max_bandwidth
+    return TransferConfig(**kwargs)
+
+
+def managed_upload(s3,
+                   local_path: str,
+                   s3url: S3Url,
+                   config: TransferConfig,
+                   progress,
+                   checksum: str | None = None,
+                   transfer=None):
+    if transfer is None:
+        with create_transfer_manager(s3, config) as mgr:
+            managed_upload(s3, local_path, s3url, config, progress,
+                           checksum=checksum, transfer=mgr)
+        return
+    extra_args = {"ChecksumAlgorithm": checksum} if checksum else None
+    transfer.upload(local_path, s3url.bucket, s3url.key,
+                    extra_args=extra_args,
+                    subscribers=[ProgressSubscriber(progress)]).result()
+
+
+def managed_download(s3,
+                     s3url: S3Url,
+                     local_path: str,
+                     config: TransferConfig,
+                     progress,
+                     size: int | None = None,
+                     transfer=None):
+    if transfer is None:
+        with create_transfer_manager(s3, config) as mgr:
+            managed_download(s3, s3url, local_path, config, progress,
+                             size=size, transfer=mgr)
+        return
+    ensure_parent(local_path)
+    transfer.download(s3url.bucket, s3url.key, local_path,
+                      subscribers=[ProgressSubscriber(progress, size)]).result()
+
+
+class TransferSession:
+    """
+    Part-level executor, rate limiter and transfer manager shared by every
+    file in one command, so threads and connections are reused and
+    --max-mbps caps the whole command rather than each file: legacy
+    transfers all draw on ``rate``, managed ones on the manager's
+    max_bandwidth.
+    """
+
+    def __init__(self, s3, args):
+        self.rate = RateLimiter(rate_limit_bytes(args))
+        self.executor = ThreadPoolExecutor(max_workers=args.workers)
+        self.transfer = None
+        if not getattr(args, "legacy_transfer", False):
+            self.transfer = create_transfer_manager(s3, make_transfer_config(args))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.executor.shutdown()
+        if self.transfer is not None:
+            self.transfer.__exit__(*exc_info)
+
+
+def upload_file(s3, local_path: str, s3url: S3Url, args, progress,
+                size: int | None = None,
+                session: TransferSession | None = None):
+    """
+    Upload one file with the managed client or the legacy code path, using
+    ``session``'s shared resources when given.
+    """
+    checksum = checksum_algorithm(args)
+    if getattr(args, "legacy_transfer", False) or checksum == "MD5":
+        rate = session.rate if session else RateLimiter(rate_limit_bytes(args))
+        multipart_upload(s3, local_path, s3url,
+                         args.workers, args.part_size,
+                         progress, rate,
+                         checksum=checksum, size=size,
+                         executor=session.executor if session else None)
+    else:
+        managed_upload(s3, local_path, s3url, make_transfer_config(args),
+                       progress, checksum=checksum,
+                       transfer=session.transfer if session else None)
+
+
+def download_file(s3, s3url: S3Url, local_path: str, args, progress,
+                  size: int | None = None,
+                  session: TransferSession | None = None):
+    """
+    Download one object with the managed client or the legacy code path,
+    using ``session``'s shared resources when given. A known ``size``
+    spares either path its HEAD request.
+    """
+    if getattr(args, "legacy_transfer", False):
+        rate = session.rate if session else RateLimiter(rate_limit_bytes(args))
+        parallel_download(s3, s3url, local_path,
+                          args.workers, args.part_size,
+                          progress, rate, size=size,
+                          executor=session.executor if session else None)
+    else:
+        managed_download(s3, s3url, local_path, make_transfer_config(args),
+                         progress, size=size,
+                         transfer=session.transfer if session else None)
 
 # --------------------------
 # Commands
 # --------------------------
 
+def large_file_slots(workers: int) -> int:
+    """How many large (multipart) files may transfer at the same time."""
+    return max(1, workers // 4)
+
+
 def cmd_upload(args, s3, config) -> dict:
     stats = {"uploaded": 0, "downloaded": 0, "skipped": 0, "failed": 0}
-    src = args.src
+    # Normalised so paths from iter_files share src's exact spelling and
+    # each key is a plain slice (no "//" from "data//" style arguments).
+    src = os.path.normpath(args.src)
     dest = parse_s3_url(args.dest)
-    for root, _, files in os.walk(src):
-        for f in files:
-            local = os.path.join(root, f)
-            key = os.path.relpath(local, src).replace("\\", "/")
-            s3url = S3Url(dest.bucket, dest.key.rstrip("/") + "/" + key)
-            try:
-                fsize = os.path.getsize(local)
-                print(f"Uploading {local} -> s3://{s3url.bucket}/{s3url.key}")
-                pbar = tqdm(total=fsize, unit="B", unit_scale=True,
-                            desc="Upload", dynamic_ncols=True)
-                multipart_upload(s3, local, s3url,
-                                 args.workers,
-                                 args.part_size,
-                                 pbar,
-                                 RateLimiter(args.max_mbps))
-                pbar.close()
-                stats["uploaded"] += 1
-            except Exception as e:
-                print(f"Upload failed: {e}")
-                stats["failed"] += 1
+    dest_prefix = dest.key.rstrip("/") + "/" if dest.key else ""
+    src_len = len(src.rstrip(os.sep + (os.altsep or ""))) + 1
+    files = []
+    for local, fsize in iter_files(src):
+        key = local[src_len:]
+        if os.sep != "/":
+            key = key.replace(os.sep, "/")
+        files.append((local, S3Url(dest.bucket, dest_prefix + key), fsize))
+
+    # Small files are single PUTs fanned out across the file pool; large
+    # files send their parts through the session's shared part pool, so
+    # only a few go at once. Both sizes go through upload_file so a single
+    # limiter (the session's, or the transfer manager's) caps the command.
+    large_slots = threading.Semaphore(large_file_slots(args.workers))
+    pbar = make_progress(sum(item[2] for item in files), "Upload")
+
+    def upload_one(local, s3url, fsize):
+        pbar.write(f"Uploading {local} -> s3://{s3url.bucket}/{s3url.key}")
+        large = not fits_single_part(fsize, args.part_size)
+        with large_slots if large else contextlib.nullcontext():
+            upload_file(s3, local, s3url, args, pbar, size=fsize,
+                        session=session)
+
+    with TransferSession(s3, args) as session, \
+            ThreadPoolExecutor(max_workers=args.workers) as ex:
+        futures = {ex.submit(upload_one, *item): item[0] for item in files}
+        try:
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                    stats["uploaded"] += 1
+                except Exception as e:
+                    pbar.write(f"Upload failed: {futures[fut]}: {e}")
+                    stats["failed"] += 1
+        except BaseException:
+            # Ctrl-C: drop the queued files so only those in flight finish.
+            for fut in futures:
+                fut.cancel()
+            raise
+    pbar.close()
     return stats
 
 
@@ -284,23 +1001,51 @@ def cmd_download(args, s3, config) -> dict:
     stats = {"uploaded": 0, "downloaded": 0, "skipped": 0, "failed": 0}
     src = parse_s3_url(args.src)
     dest = args.dest
-    resp = s3.list_objects_v2(Bucket=src.bucket, Prefix=src.key)
-    for obj in resp.get("Contents", []):
-        key = obj["Key"]
-        out = os.path.join(dest, os.path.basename(key))
+    # Keys keep their hierarchy below the last "/" of the source prefix.
+    base = src.key[:src.key.rfind("/") + 1]
+
+    large_slots = threading.Semaphore(large_file_slots(args.workers))
+    pbar = make_progress(0, "Download")
+
+    def download_one(key, size, out):
+        pbar.write(f"Downloading s3://{src.bucket}/{key} -> {out}")
+        large = not fits_single_part(size, args.part_size)
+        with large_slots if large else contextlib.nullcontext():
+            download_file(s3, S3Url(src.bucket, key), out, args, pbar,
+                          size=size, session=session)
+
+    paginator = s3.get_paginator("list_objects_v2")
+    with TransferSession(s3, args) as session, \
+            ThreadPoolExecutor(max_workers=args.workers) as ex:
+        futures = {}
         try:
-            size = obj["Size"]
-            print(f"Downloading s3://{src.bucket}/{key} -> {out}")
-            pbar = tqdm(total=size, unit="B", unit_scale=True,
-                        desc="Download", dynamic_ncols=True)
-            parallel_download(s3, S3Url(src.bucket, key), out,
-                              args.workers, args.part_size,
-                              pbar, RateLimiter(args.max_mbps))
-            pbar.close()
-            stats["downloaded"] += 1
-        except Exception as e:
-            print(f"Download failed: {e}")
-            stats["failed"] += 1
+            for page in paginator.paginate(Bucket=src.bucket, Prefix=src.key):
+                for obj in page.get("Contents", []):
+                    key = obj["Key"]
+                    rel = key[len(base):]
+                    if not rel or key.endswith("/"):
+                        continue
+                    if ".." in rel.split("/"):
+                        pbar.write(f"Skipping unsafe key: {key}")
+                        stats["skipped"] += 1
+                        continue
+                    out = os.path.join(dest, *rel.split("/"))
+                    pbar.add_total(obj["Size"])
+                    fut = ex.submit(download_one, key, obj["Size"], out)
+                    futures[fut] = key
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                    stats["downloaded"] += 1
+                except Exception as e:
+                    pbar.write(f"Download failed: {futures[fut]}: {e}")
+                    stats["failed"] += 1
+        except BaseException:
+            # Ctrl-C: drop the queued keys so only those in flight finish.
+            for fut in futures:
+                fut.cancel()
+            raise
+    pbar.close()
     return stats
 
 # --------------------------
@@ -371,11 +1116,9 @@ def cmd_browse(args, s3, config):
                 out = os.path.basename(key)
                 size = itm[2]
                 print(f"Downloading s3://{bucket}/{key} -> {out}")
-                pbar = tqdm(total=size, unit="B", unit_scale=True,
-                            desc="Download", dynamic_ncols=True)
-                parallel_download(s3, S3Url(bucket, key), out,
-                                  args.workers, args.part_size,
-                                  pbar, RateLimiter(args.max_mbps))
+                pbar = make_progress(size, "Download")
+                download_file(s3, S3Url(bucket, key), out, args, pbar,
+                              size=size)
                 pbar.close()
         elif choice.startswith("u "):
             path = choice[2:].strip()
@@ -384,11 +1127,8 @@ def cmd_browse(args, s3, config):
                 key = prefix + fname
                 fsize = os.path.getsize(path)
                 print(f"Uploading {path} -> s3://{bucket}/{key}")
-                pbar = tqdm(total=fsize, unit="B", unit_scale=True,
-                            desc="Upload", dynamic_ncols=True)
-                multipart_upload(s3, path, S3Url(bucket, key),
-                                 args.workers, args.part_size,
-                                 pbar, RateLimiter(args.max_mbps))
+                pbar = make_progress(fsize, "Upload")
+                upload_file(s3, path, S3Url(bucket, key), args, pbar)
                 pbar.close()
             else:
                 print("Path not found or not a file.")
@@ -405,7 +1145,18 @@ def cmd_sync(args, s3, config) -> dict:
     src_is_s3 = is_s3_uri(args.src)
     dest_is_s3 = is_s3_uri(args.dest)
 
-    if src_is_s3 and not dest_is_s3:
+    if src_is_s3 == dest_is_s3:
+        print("Sync between two S3 buckets or two local folders is not implemented yet.")
+        return stats
+
+    with TransferSession(s3, args) as session:
+        sync_transfers(args, s3, src_is_s3, session, stats)
+    return stats
+
+
+def sync_transfers(args, s3, src_is_s3: bool, session: TransferSession,
+                   stats: dict) -> None:
+    if src_is_s3:
         # S3 -> local
         src = parse_s3_url(args.src)
         dest = args.dest
@@ -415,28 +1166,48 @@ def cmd_sync(args, s3, config) -> dict:
             dest_path = os.path.join(dest, os.path.basename(key))
             size = obj["Size"]
             print(f"Downloading {key} -> {dest_path}")
-            pbar = tqdm(total=size, unit="B", unit_scale=True, desc="Sync download", dynamic_ncols=True)
-            parallel_download(s3, S3Url(src.bucket, key), dest_path, args.workers, args.part_size, pbar, RateLimiter(args.max_mbps))
+            pbar = make_progress(size, "Sync download")
+            download_file(s3, S3Url(src.bucket, key), dest_path, args, pbar,
+                          size=size, session=session)
             pbar.close()
             stats["downloaded"] += 1
-    elif not src_is_s3 and dest_is_s3:
+    else:
         # Local -> S3
         src = args.src
         dest = parse_s3_url(args.dest)
         for root, _, files in os.walk(src):
             for f in files:
+                if f.endswith(RESUME_SUFFIX):
+                    continue
                 local = os.path.join(root, f)
                 rel_key = os.path.relpath(local, src).replace("\\", "/")
                 s3url = S3Url(dest.bucket, dest.key.rstrip("/") + "/" + rel_key)
                 print(f"Uploading {local} -> s3://{s3url.bucket}/{s3url.key}")
                 fsize = os.path.getsize(local)
-                pbar = tqdm(total=fsize, unit="B", unit_scale=True, desc="Sync upload", dynamic_ncols=True)
-                multipart_upload(s3, local, s3url, args.workers, args.part_size, pbar, RateLimiter(args.max_mbps))
+                pbar = make_progress(fsize, "Sync upload")
+                upload_file(s3, local, s3url, args, pbar, session=session)
                 pbar.close()
                 stats["uploaded"] += 1
-    else:
-        print("Sync between two S3 buckets or two local folders is not implemented yet.")
-    return stats
+
+
+def cmd_abort(args, s3, config) -> None:
+    """Abort unfinished multipart uploads under an S3 prefix."""
+    target = parse_s3_url(args.target)
+    aborted = failed = 0
+    paginator = s3.get_paginator("list_multipart_uploads")
+    for page in paginator.paginate(Bucket=target.bucket, Prefix=target.key):
+        for upload in page.get("Uploads", []):
+            print(f"Aborting s3://{target.bucket}/{upload['Key']} "
+                  f"({upload['UploadId']})")
+            try:
+                s3.abort_multipart_upload(Bucket=target.bucket,
+                                          Key=upload["Key"],
+                                          UploadId=upload["UploadId"])
+                aborted += 1
+            except ClientError as e:
+                print(f"Abort failed: {e}")
+                failed += 1
+    print(f"\nSummary: aborted={aborted}, failed={failed}")
 
 # --------------------------
 # Parser 
@@ -468,9 +1239,14 @@ def build_parser(config: dict) -> argparse.ArgumentParser:
     common.add_argument("--part-size", type=positive_int_mb,
                         default=config.get("default_part_size_mb", DEFAULT_PART_MB) * 1024 * 1024,
                         action=StoreExplicit)
-    common.add_argument("--checksum", action="store_true")
-    common.add_argument("--max-mbps", type=float)
+    common.add_argument("--checksum", action="store_true",
+                        help=f"Have S3 verify each uploaded part ({CHECKSUM_ALGORITHM})")
+    common.add_argument("--legacy-md5", action="store_true",
+                        help="Verify uploaded parts with Content-MD5 (S3-compatible endpoints)")
+    common.add_argument("--max-mbps", type=float, help="Cap transfer throughput in MB/s")
     common.add_argument("--force", action="store_true")
+    common.add_argument("--legacy-transfer", action="store_true",
+                        help="Use the built-in multipart code instead of boto3's transfer manager")
     common.add_argument("--profile", type=str, help="AWS CLI profile name")  # ← adding   profile support
 
     up = sub.add_parser("upload", parents=[common])
@@ -486,6 +1262,10 @@ def build_parser(config: dict) -> argparse.ArgumentParser:
     sy.add_argument("dest")
 
     sub.add_parser("browse", parents=[common])
+
+    ab = sub.add_parser("abort",
+                        help="Abort unfinished multipart uploads under an S3 prefix")
+    ab.add_argument("target")
     return p
 
 
@@ -494,7 +1274,7 @@ def build_parser(config: dict) -> argparse.ArgumentParser:
 # --------------------------
 
 def main():
-    os.system("cls" if os.name == "nt" else "clear")
+    clear_screen()
     print("s3smart - Fast, Reliable AWS S3 Transfers & Sync Utility\n")
     print(get_version_info() + "\n")
     # print("=== S3SMART Utility ===\n")
@@ -515,16 +1295,17 @@ def main():
 
     print(f"→ Using AWS profile: {session.profile_name or 'default'}  |  region: {session.region_name or 'auto'}")
 
-    s3 = session.client(
-        "s3",
-        region_name=args.region,
-        endpoint_url=getattr(args, "endpoint_url", None),
-        config=BotoConfig(
-            retries={"max_attempts": max(3, args.retries), "mode": "standard"},
-            max_pool_connections=max(10, args.max_pool),
-            signature_version="s3v4",
-        ),
-    )
+    workers = getattr(args, "workers", None)
+    if workers is not None and args.max_pool < workers:
+        print(f"Warning: --max-pool {args.max_pool} is below --workers {workers}; "
+              "connections would be discarded and re-established")
+    args.max_pool = max(args.max_pool, required_pool_size(args))
+
+    s3 = make_s3_client(args.region,
+                        args.max_pool,
+                        args.retries,
+                        getattr(args, "endpoint_url", None),
+                        session=session)
     try:
         s3.list_buckets()
     except ClientError as e:
@@ -542,6 +1323,9 @@ def main():
         elif args.cmd == "browse":
             cmd_browse(args, s3, config)
             return
+        elif args.cmd == "abort":
+            cmd_abort(args, s3, config)
+            return
         else:
             stats = {}
 